@@ -0,0 +1,59 @@
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+import numpy as np
+from dwt import convolve_cost, transform
+from dwt_coeff import DWTCoeff, MAX_SCALE
+
+# shared by every session; NumPy releases the GIL inside the convolutions
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dwt")
+
+
+class ScaleJob:
+    # computes the scales of one signal in the background, cheapest (by the
+    # convolution path each kernel takes) first, so the first charts can be
+    # drawn before the rest is done
+    def __init__(self, signal, key, scalecount=MAX_SCALE, coeff=None):
+        coeff = coeff if coeff is not None else DWTCoeff()
+        self.key = key
+        self.scalecount = scalecount
+        self._signal = signal
+        self._cancelled = threading.Event()
+        n = np.shape(signal)[-1]
+        order = sorted(range(1, scalecount + 1), key=lambda j: convolve_cost(n, len(coeff.get_filter(j))))
+        self.futures = {_executor.submit(self._compute, j): j for j in order}
+
+    def _compute(self, j):
+        if self._cancelled.is_set():
+            raise CancelledError()
+        return transform(self._signal, scales=[j])[0]
+
+    def cancel(self):
+        self._cancelled.set()
+        for future in self.futures:
+            future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def progress(self):
+        return sum(f.done() for f in self.futures) / len(self.futures)
+
+    def as_completed(self):
+        # (scale, row) pairs as they finish, blocking until the next one is ready
+        for future in as_completed(self.futures):
+            yield self.futures[future], future.result()
+
+    def result(self):
+        # full (scalecount, N) matrix, waits for every scale
+        rows = {j: f.result() for f, j in self.futures.items()}
+        return np.stack([rows[j] for j in range(1, self.scalecount + 1)])
+
+
+def cancel_session_job(session_state, name="dwt_job"):
+    # pages that do not show the job stop it when the user navigates to them
+    job = session_state.get(name)
+    if job is not None and job.progress < 1:
+        job.cancel()
+        del session_state[name]
@@ -0,0 +1,111 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from deps import handler, Signal
+from cache import get_dwt
+from dwt import DWT8_SCALE
+import dwt_coeff
+from dwt_coeff import FilterBank, MAX_SCALE
+from instrument import recorder
+
+def _init_worker(filters):
+    # workers reuse the parent's filters instead of rebuilding them
+    dwt_coeff.default_bank = FilterBank(filters=filters)
+
+
+def is_recording(name):
+    # dwt8 outputs (meta carries their scale) and coefficient files (header
+    # lists scales) are results, not inputs; unreadable headers are left to
+    # process() to report
+    try:
+        header = handler.header(name)
+    except (OSError, ValueError):
+        return True
+    return "scales" not in header and "scale" not in header.get("meta", {})
+
+
+def find_inputs(patterns):
+    # directories expand to their .sig files, anything else is a glob;
+    # earlier outputs are never fed back in
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.sig")
+        paths.extend(sorted(glob.glob(pattern)))
+    names = [p[:-len(".sig")] for p in paths if p.endswith(".sig")]
+    return [n for n in dict.fromkeys(names) if is_recording(n)]
+
+
+def process(name, scalecount=MAX_SCALE):
+    # the worker's timings go back with the result and are merged by run();
+    # a failing file returns its error instead of stopping the pool
+    recorder.reset()
+    t0 = time.perf_counter()
+    try:
+        sig = handler.load_signal(name)
+        res = get_dwt(sig, scalecount)
+        handler.save_signal(Signal(res[DWT8_SCALE], res.sample_rate, res.t0), f"{name}_dwt8",
+                            meta={"source": os.path.basename(name), "scale": DWT8_SCALE})
+    except Exception as e:
+        return name, 0, time.perf_counter() - t0, recorder.report(), f"{type(e).__name__}: {e}"
+    return name, sig.value.size, time.perf_counter() - t0, recorder.report(), None
+
+
+def run(names, workers=None, scalecount=MAX_SCALE, verbose=False):
+    workers = workers or os.cpu_count()
+    filters = dwt_coeff.default_bank.all(scalecount)
+    chunksize = max(1, len(names) // (workers * 4))
+    total = 0
+    failed = {}
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(filters,)) as pool:
+        for name, n, seconds, report, error in pool.map(process, names, [scalecount] * len(names),
+                                                        chunksize=chunksize):
+            recorder.merge(report)
+            total += n
+            if error is not None:
+                failed[name] = error
+                print(f"{name}: failed, {error}")
+            elif verbose:
+                print(f"{name}: {n} samples in {seconds:.3f} s")
+    elapsed = time.perf_counter() - t0
+    return {
+        "files": len(names) - len(failed),
+        "failed": failed,
+        "samples": total,
+        "seconds": elapsed,
+        "files_per_s": (len(names) - len(failed)) / elapsed if elapsed else 0.0,
+        "samples_per_s": total / elapsed if elapsed else 0.0,
+        "workers": workers,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch DWT over many PPG recordings.")
+    parser.add_argument("inputs", nargs="+", help="directories or glob patterns of .sig files")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--scales", type=int, default=MAX_SCALE)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument("--timings", help="write per-stage timings to this JSON file")
+    args = parser.parse_args(argv)
+
+    if not DWT8_SCALE <= args.scales <= MAX_SCALE:
+        parser.error(f"--scales must be between {DWT8_SCALE} and {MAX_SCALE}, dwt8 is scale {DWT8_SCALE}")
+    names = find_inputs(args.inputs)
+    if not names:
+        parser.error("no input signal files found")
+    stats = run(names, args.workers, args.scales, args.verbose)
+    print(f"{stats['files']} files, {stats['samples']} samples in {stats['seconds']:.2f} s "
+          f"with {stats['workers']} workers: {stats['files_per_s']:.1f} files/s, "
+          f"{stats['samples_per_s'] / 1e6:.2f} Msamples/s"
+          + (f", {len(stats['failed'])} failed" if stats['failed'] else ""))
+    for name, s in sorted(recorder.report()["stages"].items()):
+        print(f"  {name:<24} {s['count']:6d} x {s['mean'] * 1e3:9.3f} ms = {s['total']:8.3f} s")
+    if args.timings:
+        recorder.to_json(args.timings)
+
+
+if __name__ == "__main__":
+    main()
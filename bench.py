@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import numpy as np
+from deps import handler
+from dwt import transform
+from dwt_coeff import DWTCoeff, FilterBank, MAX_SCALE, build_filter
+from synth import synthetic_ppg
+
+LENGTHS = [10_000, 100_000, 1_000_000, 10_000_000]
+# figures send every point to plotly, keep them to realistic sizes
+FIGURE_MAX_LENGTH = 1_000_000
+# a case is a regression when its best time exceeds baseline * THRESHOLD
+THRESHOLD = 1.25
+
+
+def timeit(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {"min": min(times), "median": statistics.median(times), "repeat": repeat}
+
+
+def cases(lengths, tmpdir):
+    for j in range(1, MAX_SCALE + 1):
+        yield f"filter_build/s{j}", lambda j=j: build_filter(j), 20
+        yield f"filter_expand/s{j}", lambda j=j: DWTCoeff()._expand_filter(j), 3
+    yield "filter_bank/all", lambda: FilterBank().all(), 20
+
+    try:
+        from plots import scale_figure
+    except ImportError:
+        scale_figure = None
+
+    for n in lengths:
+        t, x = synthetic_ppg(n)
+        repeat = 5 if n <= 1_000_000 else 2
+        yield f"transform/{n}", lambda x=x: transform(x), repeat
+
+        name = os.path.join(tmpdir, f"synth{n}")
+        yield f"handler_save/{n}", lambda t=t, x=x, name=name: handler.save(t, x, name), repeat
+        if not os.path.exists(f"{name}.sig"):
+            handler.save(t, x, name)
+        yield f"handler_load/{n}", lambda name=name: float(handler.load(name).value.sum()), repeat
+
+        if scale_figure is not None and n <= FIGURE_MAX_LENGTH:
+            yield f"figure/{n}", lambda t=t, x=x: scale_figure(t, x, x, 1), repeat
+
+
+def run(lengths, only=None):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, fn, repeat in cases(lengths, tmpdir):
+            if only and not any(name.startswith(o) for o in only):
+                continue
+            results[name] = timeit(fn, repeat)
+            print(f"{name:<28} {results[name]['min'] * 1e3:10.3f} ms")
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=THRESHOLD):
+    regressions = []
+    for name, res in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = res["min"] / base["min"] if base["min"] else float("inf")
+        flag = "REGRESSION" if ratio > threshold else ""
+        print(f"{name:<28} {base['min'] * 1e3:10.3f} -> {res['min'] * 1e3:10.3f} ms  x{ratio:5.2f} {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the DWT pipeline.")
+    parser.add_argument("--lengths", type=int, nargs="+", default=LENGTHS)
+    parser.add_argument("--only", nargs="+", help="run cases whose name starts with these prefixes")
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    parser.add_argument("--baseline", default="bench_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args(argv)
+
+    current = run(args.lengths, args.only)
+    with open(args.output, 'w') as file:
+        json.dump(current, file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(current, file, indent=2)
+        print(f"baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,152 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+from deps import handler, Signal, DWTResult
+from dwt import transform
+from dwt_coeff import FILTER_VERSION, MAX_SCALE
+from instrument import count, timed
+
+CACHE_DIR = os.environ.get("DWT_CACHE_DIR", ".dwt_cache")
+MEMORY_BYTES = 512 * 1024**2
+DISK_BYTES = 4 * 1024**3
+
+
+@timed("cache.hash")
+def content_key(signal, scalecount=MAX_SCALE):
+    # hash of the samples plus everything that changes the transform output
+    x = np.ascontiguousarray(signal, dtype=np.float64)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"dwt:v{FILTER_VERSION}:s{scalecount}:{x.shape}".encode())
+    h.update(memoryview(x).cast('B'))
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=256)
+def _file_key(name, mtime_ns, size, scalecount):
+    return content_key(handler.load(name).value, scalecount)
+
+
+def file_key(name, scalecount=MAX_SCALE):
+    # content_key of a stored recording, hashed again only when the file's
+    # mtime or size changes
+    name = os.path.abspath(name)
+    st = os.stat(f"{name}.sig")
+    return _file_key(name, st.st_mtime_ns, st.st_size, scalecount)
+
+
+class DWTCache:
+    # two tiers: an in-memory LRU and .npy files on disk, both bounded in bytes
+    def __init__(self, cache_dir=CACHE_DIR, memory_bytes=MEMORY_BYTES, disk_bytes=DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+
+    def get(self, signal, scalecount=MAX_SCALE, key=None):
+        key = key or content_key(signal, scalecount)
+        w2fb = self.peek(key)
+        if w2fb is None:
+            self.misses += 1
+            count("cache.miss")
+            w2fb = transform(signal, scalecount)
+            self.put(key, w2fb)
+        return w2fb
+
+    def peek(self, key):
+        # cached matrix for key from either tier, None instead of computing it
+        with self._lock:
+            w2fb = self._memory.get(key)
+            if w2fb is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                count("cache.hit")
+                return w2fb
+        w2fb = self._load(key)
+        if w2fb is not None:
+            self.disk_hits += 1
+            count("cache.disk_hit")
+            self._remember(key, w2fb)
+        return w2fb
+
+    def put(self, key, w2fb):
+        # store a matrix computed elsewhere, e.g. by a background job
+        w2fb.setflags(write=False)
+        self._store(key, w2fb)
+        self._remember(key, w2fb)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def _remember(self, key, w2fb):
+        with self._lock:
+            self._memory[key] = w2fb
+            self._memory.move_to_end(key)
+            size = sum(a.nbytes for a in self._memory.values())
+            while size > self.memory_bytes and len(self._memory) > 1:
+                _, old = self._memory.popitem(last=False)
+                size -= old.nbytes
+
+    def _load(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            w2fb = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return w2fb
+
+    def _store(self, key, w2fb):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as file:
+            np.save(file, w2fb)
+        os.replace(tmp, path)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        # least recently used files first, mtime is bumped on every hit
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npy"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        size = sum(e[1] for e in entries)
+        for _, nbytes, path in entries[:-1]:
+            if size <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= nbytes
+
+    def clear(self, disk=False):
+        with self._lock:
+            self._memory.clear()
+        if disk and self.cache_dir and os.path.isdir(self.cache_dir):
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".npy"):
+                    os.remove(entry.path)
+
+
+# one cache per process, shared by the pages and batch jobs
+default_cache = DWTCache()
+
+
+def get_dwt(signal, scalecount=MAX_SCALE, key=None):
+    # a Signal gives a DWTResult on its time base, arrays the bare coefficients
+    if isinstance(signal, Signal):
+        w2fb = default_cache.get(signal.value, scalecount, key)
+        return DWTResult(w2fb, range(1, scalecount + 1), signal.sample_rate, signal.t0)
+    return default_cache.get(signal, scalecount, key)
@@ -0,0 +1,58 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from deps import handler
+from dwt import transform
+from dwt_coeff import MAX_SCALE
+from instrument import stage
+
+# output columns per chunk; each chunk also reads its kernels' margin
+CHUNK = 1 << 20
+
+
+def transform_to_file(source, dest, scalecount=MAX_SCALE, chunk=CHUNK, workers=None,
+                      dtype=np.float64):
+    # out-of-core transform of the recording in source.sig into dest.sig.
+    # Chunks are independent windows of transform(), so seams are exact; they
+    # run on a thread pool and write straight into the memory-mapped output,
+    # which handler.load/load_signal read back as (..., scales, N).
+    src = handler.load_signal(source)
+    n = len(src)
+    scales = list(range(1, scalecount + 1))
+    shape = src.value.shape[:-1] + (len(scales), n)
+    out = handler.create(dest, shape, dtype, src.sample_rate, src.t0, scales=scales,
+                         meta={"source": source})
+
+    def work(a):
+        b = min(a + chunk, n)
+        out[..., a:b] = transform(src.value, scales=scales, start=a, stop=b, dtype=dtype)
+
+    with stage("transform.chunked"), ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+        for _ in pool.map(work, range(0, n, chunk)):
+            pass
+    if isinstance(out, np.memmap):
+        out.flush()
+    return handler.load_signal(dest)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Out-of-core DWT of a .sig recording.")
+    parser.add_argument("source", help="input recording, without .sig")
+    parser.add_argument("dest", help="output file, without .sig")
+    parser.add_argument("--scales", type=int, default=MAX_SCALE)
+    parser.add_argument("--chunk", type=int, default=CHUNK)
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--float32", action="store_true")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    res = transform_to_file(args.source, args.dest, args.scales, args.chunk, args.workers,
+                            np.float32 if args.float32 else np.float64)
+    elapsed = time.perf_counter() - t0
+    print(f"{len(res)} samples x {len(res.scales)} scales in {elapsed:.2f} s -> {args.dest}.sig")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,259 @@
+import json
+import os
 import pickle
+import struct
+import numpy as np
+from instrument import timed
+
+# .sig layout: magic, uint32 header length, JSON header, then the time and
+# value arrays stored contiguously at 64-byte aligned offsets
+MAGIC = b"PPGSIG\x00\x01"
+_ALIGN = 64
+
+
+def _aligned(n):
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def _sample_rate(time):
+    # mean step over the whole record, robust to a rounded time column
+    if len(time) < 2 or time[-1] <= time[0]:
+        return None
+    return float((len(time) - 1) / (time[-1] - time[0]))
+
+
+class Signal:
+    # uniformly sampled signal, time is t0 + n / sample_rate instead of an
+    # array; value is (N,) or (channels, N)
+    __slots__ = ("value", "sample_rate", "t0", "filename")
+
+    def __init__(self, value, sample_rate, t0=0.0, filename=None):
+        self.value = value
+        self.sample_rate = sample_rate
+        self.t0 = t0
+        self.filename = filename
+
+    def __len__(self):
+        return self.value.shape[-1]
+
+    @property
+    def time(self):
+        return self.t0 + np.arange(len(self)) / self.sample_rate
+
+    @property
+    def nbytes(self):
+        return self.value.nbytes
+
+
+class DWTResult:
+    # coefficients of the requested scales only, data[i] holds scales[i]
+    __slots__ = ("data", "scales", "sample_rate", "t0")
+
+    def __init__(self, data, scales, sample_rate, t0=0.0):
+        self.data = data
+        self.scales = tuple(scales)
+        self.sample_rate = sample_rate
+        self.t0 = t0
+
+    def __getitem__(self, scale):
+        return self.data[..., self.scales.index(scale), :]
+
+    def __len__(self):
+        return self.data.shape[-1]
+
+    @property
+    def time(self):
+        return self.t0 + np.arange(len(self)) / self.sample_rate
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+
+def _uniform(time, sample_rate):
+    # True when the timestamps are the grid t0 + n / sample_rate up to float
+    # rounding, so dropping them loses nothing
+    if sample_rate is None:
+        return False
+    grid = time[0] + np.arange(len(time)) / sample_rate
+    return bool(np.abs(time - grid).max() <= 1e-6 / sample_rate)
+
 
 class handler():
-    def __init__(self, time, value, filename):
-        self.time = time
+    def __init__(self, time, value, filename, sample_rate=None, t0=0.0):
+        # time None: uniform record, built from t0 and sample_rate on first use
+        self._time = time
         self.value = value
         self.filename = filename
+        self.sample_rate = sample_rate
+        self.t0 = t0 if time is None or not len(time) else float(time[0])
+
+    def __setstate__(self, state):
+        # legacy .dat pickles keep the time array in time, not _time
+        state = dict(state)
+        if "time" in state:
+            state["_time"] = state.pop("time")
+        self.__dict__.update(state)
+        self.__dict__.setdefault("sample_rate", None)
+        self.__dict__.setdefault("t0", 0.0)
+
+    @property
+    def time(self):
+        if self._time is None:
+            n = self.value.shape[-1]
+            self._time = self.t0 + np.arange(n) / self.sample_rate if n else np.zeros(0)
+        return self._time
 
     @staticmethod
-    def save(index, pleth, filename):
+    def save(index, pleth, filename, sample_rate=None, meta=None, uniform=False):
+        # meta: small JSON-serialisable dict kept in the header. A record on
+        # an exact grid, or any record with uniform=True (the caller accepts
+        # t0 + n / sample_rate in place of its timestamps), is stored as in
+        # save_signal, without time
         if len(index) and len(pleth) != 0:
-            dataobj = handler(index, pleth, filename)
-            with open(f"{filename}.dat", 'wb') as file:
-                pickle.dump(dataobj, file)
-    
+            time = np.ascontiguousarray(index, dtype=np.float64)
+            if sample_rate is None:
+                sample_rate = _sample_rate(time)
+            if (uniform and sample_rate is not None) or _uniform(time, sample_rate):
+                handler._write(filename, None, pleth, {"sample_rate": sample_rate, "t0": float(time[0]),
+                                                      "meta": meta or {}})
+            else:
+                handler._write(filename, time, pleth, {"sample_rate": sample_rate, "meta": meta or {}})
+
+    @staticmethod
+    def save_signal(sig, filename, meta=None):
+        # Signal or DWTResult, stored without a time array
+        value = sig.data if isinstance(sig, DWTResult) else sig.value
+        header = {"sample_rate": sig.sample_rate, "t0": sig.t0, "meta": meta or {}}
+        if isinstance(sig, DWTResult):
+            header["scales"] = list(sig.scales)
+        handler._write(filename, None, value, header)
+
+    @staticmethod
+    def _layout(filename, time, dtype, shape, extra):
+        header = {
+            "version": 1,
+            "filename": filename,
+            "dtype": np.dtype(dtype).str,
+            "shape": list(shape),
+            "time_dtype": None if time is None else time.dtype.str,
+            **extra,
+        }
+        # offsets depend on the header size, so size it with placeholders first
+        header["time_offset"] = header["value_offset"] = 0
+        base = _aligned(len(MAGIC) + 4 + len(json.dumps(header)) + 64)
+        header["time_offset"] = None if time is None else base
+        header["value_offset"] = base if time is None else _aligned(base + time.nbytes)
+        raw = json.dumps(header).encode()
+        return header, MAGIC + struct.pack("<I", len(raw)) + raw
+
+    @staticmethod
+    @timed("save")
+    def _write(filename, time, value, extra):
+        value = np.ascontiguousarray(value)
+        if value.dtype.kind != 'f':
+            value = value.astype(np.float64)
+        header, raw = handler._layout(filename, time, value.dtype, value.shape, extra)
+
+        path = f"{filename}.sig"
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as file:
+            file.write(raw)
+            if time is not None:
+                file.write(b"\0" * (header["time_offset"] - file.tell()))
+                time.tofile(file)
+            file.write(b"\0" * (header["value_offset"] - file.tell()))
+            value.tofile(file)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def create(filename, shape, dtype, sample_rate, t0=0.0, scales=None, meta=None):
+        # empty file in the save_signal layout, returns a writable memmap of
+        # the values so large results can be filled in place
+        extra = {"sample_rate": sample_rate, "t0": t0, "meta": meta or {}}
+        if scales is not None:
+            extra["scales"] = list(scales)
+        header, raw = handler._layout(filename, None, dtype, shape, extra)
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        path = f"{filename}.sig"
+        with open(path, 'wb') as file:
+            file.write(raw)
+            file.truncate(header["value_offset"] + nbytes)
+        if nbytes == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r+', offset=header["value_offset"], shape=tuple(shape))
+
+    @staticmethod
+    def header(filename):
+        with open(f"{filename}.sig", 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{filename}.sig is not a signal file.")
+            size, = struct.unpack("<I", file.read(4))
+            return json.loads(file.read(size))
+
     @staticmethod
-    def load(filename):
+    @timed("load")
+    def _open(filename):
+        # header plus read-only memmaps of the time (None if not stored) and value arrays
+        path = f"{filename}.sig"
+        if not os.path.exists(path) and os.path.exists(f"{filename}.dat"):
+            raise FileNotFoundError(f"{path} not found, convert the legacy pickle "
+                                    f"first with handler.convert({filename!r}).")
+        header = handler.header(filename)
+        shape = tuple(header["shape"])
+        time = None
+        if shape[-1] == 0:
+            value = np.zeros(shape, dtype=header["dtype"])
+        else:
+            value = np.memmap(path, dtype=header["dtype"], mode='r',
+                              offset=header["value_offset"], shape=shape)
+            if header["time_offset"] is not None:
+                time = np.memmap(path, dtype=header["time_dtype"], mode='r',
+                                 offset=header["time_offset"], shape=(shape[-1],))
+        return header, time, value
+
+    @staticmethod
+    def load(filename, start=None, stop=None):
+        # zero-copy: time and value are read-only memmaps of the file,
+        # start/stop select a window of samples along the last axis
+        # files without a time array get their time built lazily from the header
+        header, time, value = handler._open(filename)
+        window = slice(start, stop)
+        fs = header["sample_rate"]
+        if time is not None:
+            return handler(time[window], value[..., window], header["filename"], fs)
+        lo = window.indices(value.shape[-1])[0]
+        t0 = header.get("t0", 0.0) + (lo / fs if lo else 0.0)
+        return handler(None, value[..., window], header["filename"], fs, t0)
+
+    @staticmethod
+    def load_signal(filename, start=None, stop=None):
+        # compact load: Signal (or DWTResult for saved coefficients) over a memmap
+        header, time, value = handler._open(filename)
+        fs = header["sample_rate"]
+        lo = slice(start, stop).indices(value.shape[-1])[0]
+        if time is not None and lo < len(time):
+            t0 = float(time[lo])
+        else:
+            t0 = header.get("t0", 0.0) + (lo / fs if lo else 0.0)
+        value = value[..., start:stop]
+        if "scales" in header:
+            return DWTResult(value, header["scales"], fs, t0)
+        return Signal(value, fs, t0, header["filename"])
+
+    @staticmethod
+    def convert(filename):
+        # one-off migration of a pickled .dat file, only run it on trusted files
         with open(f"{filename}.dat", 'rb') as file:
             dataobj = pickle.load(file)
-            return dataobj
\ No newline at end of file
+        handler.save(np.asarray(dataobj.time), np.asarray(dataobj.value), filename)
+        return handler.load(filename)
+
+
+if __name__ == "__main__":
+    import sys
+    # python deps.py rawdata dwt8
+    for name in sys.argv[1:]:
+        var = handler.convert(name)
+        print(f"{name}.dat -> {name}.sig ({var.value.shape[-1]} samples, "
+              f"{var.sample_rate} Hz)")
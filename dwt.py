@@ -0,0 +1,216 @@
+import numpy as np
+from deps import Signal, DWTResult
+from dwt_coeff import DWTCoeff, MAX_SCALE, _H, _NORM, build_lowpass
+from instrument import count, stage, timed
+
+# kernels with at least this many taps are convolved through the FFT
+FFT_MIN_TAPS = 32
+# the same for (channels, N) input, shorter kernels run one flattened np.convolve
+FFT_MIN_TAPS_BATCHED = 16
+# number of overlap-save blocks transformed per rfft call
+_FFT_BATCH = 256
+# respiratory band, the scale written to the dwt8 files
+DWT8_SCALE = 8
+
+
+def next_pow2(n):
+    return 1 << (int(n) - 1).bit_length()
+
+
+def fft_convolve_valid(x, kernel):
+    # overlap-save along the last axis, same result as
+    # np.convolve(x, kernel, 'valid') for every leading index
+    L = len(kernel)
+    lead = x.shape[:-1]
+    n_out = x.shape[-1] - L + 1
+    nfft = max(256, next_pow2(4 * L))
+    step = nfft - L + 1
+    K = np.fft.rfft(kernel, nfft)
+    nblocks = -(-n_out // step)
+    xpad = np.zeros(lead + (nblocks * step + L - 1,))
+    xpad[..., :x.shape[-1]] = x
+    frames = np.lib.stride_tricks.sliding_window_view(xpad, nfft, axis=-1)[..., ::step, :] \
+        if xpad.shape[-1] >= nfft else xpad[..., None, :]
+    out = np.empty(lead + (nblocks, step))
+    for b in range(0, nblocks, _FFT_BATCH):
+        y = np.fft.irfft(np.fft.rfft(frames[..., b:b + _FFT_BATCH, :], nfft) * K, nfft)
+        out[..., b:b + y.shape[-2], :] = y[..., L - 1:]
+    return out.reshape(lead + (nblocks * step,))[..., :n_out]
+
+
+def _flat_convolve_valid(x, kernel):
+    # one np.convolve over all rows laid end to end; the first N-L+1 outputs
+    # of every row only ever see that row's samples
+    L = len(kernel)
+    n = x.shape[-1]
+    flat = np.convolve(np.ascontiguousarray(x).reshape(-1), kernel, 'valid')
+    out = np.empty(x.size)
+    out[:len(flat)] = flat
+    return out.reshape(x.shape)[..., :n - L + 1]
+
+
+def convolve_valid(x, kernel):
+    # valid-mode convolution along the last axis of a 1-D or (channels, N) array
+    if x.ndim == 1:
+        if len(kernel) >= FFT_MIN_TAPS:
+            return fft_convolve_valid(x, kernel)
+        return np.convolve(x, kernel, 'valid')
+    if len(kernel) >= FFT_MIN_TAPS_BATCHED:
+        return fft_convolve_valid(x, kernel)
+    return _flat_convolve_valid(x, kernel)
+
+
+def convolve_cost(n, taps):
+    # rough operation count of convolve_valid on one row of n samples, for
+    # ordering work: direct n*L, overlap-save an rfft/irfft pair per block
+    if taps >= FFT_MIN_TAPS:
+        nfft = max(256, next_pow2(4 * taps))
+        return 2 * -(-n // (nfft - taps + 1)) * nfft * np.log2(nfft)
+    return n * taps
+
+
+def transform(signal, scalecount=MAX_SCALE, coeff=None, scales=None, dtype=np.float64,
+              start=None, stop=None):
+    # a trous algo, returns a (scalecount, N) matrix, row j-1 holds scale j.
+    # With scales only those rows are allocated, in the given order; with
+    # start/stop only columns start..stop-1 are computed, from the samples
+    # that window plus each kernel's margin needs, same values as a full run.
+    # A Signal input gives a DWTResult with the matching time base.
+    if isinstance(signal, Signal):
+        scales = tuple(scales or range(1, scalecount + 1))
+        lo = slice(start, stop).indices(len(signal))[0]
+        data = transform(signal.value, coeff=coeff, scales=scales, dtype=dtype,
+                         start=start, stop=stop)
+        return DWTResult(data, scales, signal.sample_rate, signal.t0 + lo / signal.sample_rate)
+
+    coeff = coeff if coeff is not None else DWTCoeff()
+    scales = list(scales or range(1, scalecount + 1))
+    x = np.asarray(signal)
+    # (N,) gives (scales, N), (channels, N) gives (channels, scales, N)
+    total = x.shape[-1]
+    start, stop, _ = slice(start, stop).indices(total)
+    stop = max(stop, start)
+    w2fb = np.zeros(x.shape[:-1] + (len(scales), stop - start), dtype=dtype)
+    count("transform.coefficients", w2fb.size)
+    with stage("transform"):
+        for row, j in enumerate(scales):
+            res = coeff.get_filter(scale=j)
+            T = round(2**(j-1)) - 1
+            L = len(res)
+            # w2fb[j, n - T] = sum(x[n-L:n] * res[::-1]) for L <= n < total,
+            # everything outside stays zero
+            lo = max(start, L - T)
+            hi = min(stop, total - T)
+            if hi <= lo:
+                continue
+            seg = np.asarray(x[..., lo+T-L:hi+T-1], dtype=np.float64)
+            w2fb[..., row, lo-start:hi-start] = convolve_valid(seg, res)
+    return w2fb
+
+
+def approximation(signal, scalecount=MAX_SCALE):
+    # residual below detail scale scalecount, centred and edge-padded so it
+    # lines up with the input samples
+    x = np.asarray(signal, dtype=np.float64)
+    kernel = build_lowpass(scalecount)
+    L = len(kernel)
+    if x.shape[-1] == 0:
+        return x.copy()
+    pad = [(0, 0)] * (x.ndim - 1) + [(L // 2, L - 1 - L // 2)]
+    return convolve_valid(np.pad(x, pad, mode='edge'), kernel)
+
+
+class StreamingDWT:
+    # incremental a trous transform; push() returns the columns of the batch
+    # transform that can no longer change, flush() returns the rest
+    def __init__(self, scalecount=MAX_SCALE, coeff=None):
+        coeff = coeff if coeff is not None else DWTCoeff()
+        self.scalecount = scalecount
+        self.filters = [coeff.get_filter(scale=j) for j in range(1, scalecount + 1)]
+        self.delays = [round(2**(j-1)) - 1 for j in range(1, scalecount + 1)]
+        # column m of scale j reads samples m+T-L .. m+T-1
+        self._lookahead = max(self.delays)
+        self._history = max(len(res) - T for res, T in zip(self.filters, self.delays))
+        self._buf = np.zeros(0)
+        self._buf_start = 0
+        self.received = 0
+        self.emitted = 0
+        self.flushed = False
+
+    def push(self, chunk):
+        if self.flushed:
+            raise ValueError("Stream already flushed.")
+        chunk = np.asarray(chunk, dtype=np.float64).ravel()
+        self._buf = np.concatenate((self._buf, chunk))
+        self.received += len(chunk)
+        return self._emit(max(self.emitted, self.received - self._lookahead))
+
+    def flush(self):
+        if self.flushed:
+            raise ValueError("Stream already flushed.")
+        self.flushed = True
+        return self._emit(self.received)
+
+    def _window(self, a, b):
+        # samples a..b-1 of the whole signal, zeros before the first sample
+        out = np.zeros(b - a)
+        lo = max(a, 0)
+        out[lo - a:] = self._buf[lo - self._buf_start:b - self._buf_start]
+        return out
+
+    def _emit(self, stop):
+        m0, m1 = self.emitted, stop
+        cols = np.zeros((self.scalecount, m1 - m0))
+        for i, (res, T) in enumerate(zip(self.filters, self.delays)):
+            L = len(res)
+            # same range as the batch loop: L <= m + T < received
+            lo = min(max(m0, L - T), m1)
+            hi = max(min(m1, self.received - T), lo)
+            if hi > lo:
+                cols[i, lo - m0:hi - m0] = convolve_valid(self._window(lo + T - L, hi + T - 1), res)
+        self.emitted = m1
+        # keep only what the next columns still need
+        keep = max(m1 - self._history, 0)
+        self._buf = self._buf[keep - self._buf_start:]
+        self._buf_start = keep
+        return cols
+
+
+# decimated (Mallat) mode with the short prototype filters: every level
+# convolves with h and g and keeps every second sample, O(N) in total.
+# Detail j sample m equals the a trous column 2**j * m + 2 - 2**(j-1), so
+# the per-level gain brings it to the same normalisation as transform().
+_MALLAT_H = _H / 8
+_MALLAT_G = np.array([1.0, -1.0])
+
+
+@timed("transform.mallat")
+def mallat(signal, scalecount=MAX_SCALE):
+    # list of decimated details, index j-1 holds scale j
+    a = np.asarray(signal, dtype=np.float64)
+    details = []
+    for j in range(1, scalecount + 1):
+        if not len(a):
+            details.append(np.zeros(0))
+            continue
+        gain = _NORM[j] * 8**(j-1)
+        details.append(np.convolve(a, _MALLAT_G)[::2] * gain)
+        if j < scalecount:
+            a = np.convolve(a, _MALLAT_H)[::2]
+    return details
+
+
+def mallat_positions(j, count):
+    # column of the full-rate transform each decimated sample of scale j lands on
+    return 2**j * np.arange(count) + 2 - 2**(j-1)
+
+
+def mallat_upsample(detail, j, total):
+    # linear interpolation of a decimated scale back to total samples, for display
+    pos = mallat_positions(j, len(detail))
+    return np.interp(np.arange(total), pos, detail)
+
+
+def mallat_energies(details):
+    # mean squared coefficient per scale
+    return np.array([np.mean(d**2) if len(d) else 0.0 for d in details])
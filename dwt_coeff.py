@@ -1,13 +1,105 @@
+import os
 import numpy as np
+from instrument import timed
+
+FILTER_VERSION = 1
+MAX_SCALE = 8
+
+# quadratic spline prototype h (integer taps, /8 folded into _NORM)
+_H = np.array([1, 3, 3, 1], dtype=np.int64)
+# normalisation of the integer taps for every scale, same constants as the
+# explicit expansion in DWTCoeff._expand_filter
+_NORM = {1: 2, 2: 1/4, 3: 1/32, 4: 1/256, 5: 1/512, 6: 1/2048, 7: 1/8192, 8: 1/32768}
+
+
+def build_filter(scale):
+    # q_j = G(z^2^(j-1)) * prod_{i<j-1} H(z^2^i), built from the integer taps
+    if scale not in _NORM:
+        raise ValueError("Scale must be between 1 and 8.")
+    taps = np.array([1], dtype=np.int64)
+    for i in range(scale - 1):
+        up = np.zeros(3 * 2**i + 1, dtype=np.int64)
+        up[::2**i] = _H
+        taps = np.convolve(taps, up)
+    g = np.zeros(2**(scale-1) + 1, dtype=np.int64)
+    g[0], g[-1] = 1, -1
+    return np.convolve(taps, g) * _NORM[scale]
+
+
+def build_lowpass(scale):
+    # prod_{i<j} H(z^2^i) / 8^j, the smoothing left over after detail scales 1..j
+    if scale not in _NORM:
+        raise ValueError("Scale must be between 1 and 8.")
+    taps = np.array([1], dtype=np.int64)
+    for i in range(scale):
+        up = np.zeros(3 * 2**i + 1, dtype=np.int64)
+        up[::2**i] = _H
+        taps = np.convolve(taps, up)
+    return taps / 8.0**scale
+
+
+class FilterBank:
+    def __init__(self, cache_dir=None, filters=None):
+        # filters: {scale: qj} already built elsewhere, e.g. in a parent process
+        self.cache_dir = cache_dir
+        self._filters = {}
+        for scale, qj in (filters or {}).items():
+            qj = np.array(qj, dtype=np.float64)
+            qj.setflags(write=False)
+            self._filters[scale] = qj
+
+    def get(self, scale):
+        qj = self._filters.get(scale)
+        if qj is None:
+            qj = self._load(scale)
+            self._filters[scale] = qj
+        return qj
+
+    def all(self, scalecount=MAX_SCALE):
+        return {j: self.get(j) for j in range(1, scalecount + 1)}
+
+    def _path(self, scale):
+        return os.path.join(self.cache_dir, f"qj_v{FILTER_VERSION}_s{scale}.npy")
+
+    @timed("filter_build")
+    def _load(self, scale):
+        if scale not in _NORM:
+            raise ValueError("Scale must be between 1 and 8.")
+        qj = None
+        if self.cache_dir:
+            path = self._path(scale)
+            if os.path.exists(path):
+                qj = np.load(path)
+            else:
+                qj = build_filter(scale)
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, 'wb') as file:
+                    np.save(file, qj)
+                os.replace(tmp, path)
+        if qj is None:
+            qj = build_filter(scale)
+        qj.setflags(write=False)
+        return qj
+
+
+# one bank per process, shared by every DWTCoeff instance
+default_bank = FilterBank(os.environ.get("DWT_FILTER_CACHE"))
+
 
 class DWTCoeff:
-    def __init__(self):
-        pass
+    def __init__(self, bank=None):
+        self.bank = bank if bank is not None else default_bank
 
     def _dirac(self, k):
         return 1 if k == 0 else 0
 
     def get_filter(self, scale):
+        # read-only array shared through the filter bank
+        return self.bank.get(scale)
+
+    def _expand_filter(self, scale):
+        # reference expansion of the filter from the dirac sums, slow
         j = scale
         a = -(round(2**j) + round(2**(j-1)) - 2)
         b = -(1 - round(2**(j-1))) + 1
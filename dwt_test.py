@@ -2,7 +2,7 @@ import streamlit as st
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from dwt_coeff import DWTCoeff  # Your custom module
+from dwt import transform      # Your custom module
 from deps import handler        # Your custom module
 
 # --- 1. Streamlit Page Configuration ---
@@ -20,24 +20,14 @@ def compute_dwt_coefficients():
     The @st.cache_data decorator stores the result so it doesn't need to be re-calculated
     every time you interact with the app, making it much faster.
     """
-    coeff = DWTCoeff()
     var = handler.load("rawdata")
-    ppgdata = var.value.to_numpy()
-    time = var.time.to_numpy()
-    total = len(ppgdata)
-
-    w2fb = np.zeros((9, total))
+    ppgdata = np.asarray(var.value)
+    time = np.asarray(var.time)
     scalecount = 8
 
-    # a trous algo
-    for j in range(1, scalecount + 1):
-        res = coeff.get_filter(scale=j)
-        T = round(2**(j-1)) - 1
-        start = len(res)
-        for n in range(start, total):
-            signalNEW = ppgdata[n - len(res):n]
-            w2fb[j, n - T] = np.sum(signalNEW * res[::-1])
-    
+    # a trous algo, vectorized; row j-1 holds scale j
+    w2fb = transform(ppgdata, scalecount)
+
     return time, ppgdata, w2fb, scalecount
 
 # Execute the function to get the data and coefficients
@@ -58,7 +48,7 @@ try:
         # Add the DWT coefficient trace
         fig.add_trace(go.Scatter(
             x=time,
-            y=w2fb[j],
+            y=w2fb[j-1],
             mode='lines',
             line=dict(color='blue'),
             name=f'DWT Skala {j}'
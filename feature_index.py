@@ -0,0 +1,231 @@
+import argparse
+import os
+import sqlite3
+import time
+import numpy as np
+from batch import find_inputs
+from cache import content_key, get_dwt
+from deps import handler
+from dwt import DWT8_SCALE, next_pow2
+from dwt_coeff import MAX_SCALE
+from instrument import timed
+from resp import find_breaths, rate_windows
+
+DB = "features.db"
+# summary window, seconds; windows do not overlap
+WINDOW = 30.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    content_key TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    samples INTEGER NOT NULL,
+    sample_rate REAL NOT NULL,
+    window REAL NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS windows (
+    recording_id INTEGER NOT NULL REFERENCES recordings(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    start REAL NOT NULL,
+    stop REAL NOT NULL,
+    resp_rate REAL,
+    PRIMARY KEY (recording_id, idx)
+);
+CREATE TABLE IF NOT EXISTS features (
+    recording_id INTEGER NOT NULL REFERENCES recordings(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    scale INTEGER NOT NULL,
+    energy REAL NOT NULL,
+    dom_freq REAL NOT NULL,
+    mean REAL NOT NULL,
+    std REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (recording_id, idx, scale)
+);
+CREATE INDEX IF NOT EXISTS windows_resp_rate ON windows(resp_rate);
+CREATE INDEX IF NOT EXISTS features_scale_energy ON features(scale, energy);
+CREATE INDEX IF NOT EXISTS features_scale_dom_freq ON features(scale, dom_freq);
+"""
+
+
+@timed("postprocess.features")
+def window_features(w2fb, fs, window=WINDOW):
+    # per-window summaries of every scale, all windows at once. Returns the
+    # window starts (samples), an (scales, windows, 6) array of energy,
+    # dominant frequency, mean, std, min, max and the respiratory rate of
+    # the respiratory band (scale DWT8_SCALE = 8) per window.
+    wn = int(round(window * fs))
+    nwin = w2fb.shape[-1] // wn if wn else 0
+    blocks = np.asarray(w2fb[:, :nwin * wn], dtype=np.float64).reshape(len(w2fb), nwin, wn)
+    nfft = next_pow2(max(wn, 2))
+    spec = np.abs(np.fft.rfft(blocks - blocks.mean(axis=-1, keepdims=True), nfft))
+    freqs = np.fft.rfftfreq(nfft, 1 / fs)
+    dom = freqs[1:][np.argmax(spec[..., 1:], axis=-1)] if spec.shape[-1] > 1 else np.zeros(blocks.shape[:2])
+    stats = np.stack((
+        (blocks ** 2).mean(axis=-1),
+        dom,
+        blocks.mean(axis=-1),
+        blocks.std(axis=-1),
+        blocks.min(axis=-1, initial=np.inf),
+        blocks.max(axis=-1, initial=-np.inf),
+    ), axis=-1)
+    band = np.asarray(w2fb[DWT8_SCALE-1], dtype=np.float64)
+    starts, rate = rate_windows(find_breaths(band, fs), nwin * wn, fs, window, window)
+    return starts, stats, rate
+
+
+class FeatureIndex:
+    def __init__(self, path=DB):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _current(self, name, window):
+        # (id, content key) when the stored entry may be reused, else None
+        row = self.db.execute("SELECT id, content_key, mtime, window FROM recordings WHERE name = ?",
+                              (name,)).fetchone()
+        if row is None or row[3] != window:
+            return None
+        return row
+
+    def add(self, name, window=WINDOW, force=False):
+        # index one recording; unchanged recordings are skipped (mtime first,
+        # then the content hash). Returns True when it was (re)indexed.
+        header = handler.header(name)
+        if "scales" in header:
+            raise ValueError(f"{name}: holds DWT coefficients, not a recording.")
+        if len(header["shape"]) != 1:
+            raise ValueError(f"{name}: only single-channel recordings can be indexed.")
+        mtime = os.path.getmtime(f"{name}.sig")
+        row = None if force else self._current(name, window)
+        if row is not None and row[2] == mtime:
+            return False
+        var = handler.load(name)
+        key = content_key(var.value, MAX_SCALE)
+        if row is not None and row[1] == key:
+            with self.db:
+                self.db.execute("UPDATE recordings SET mtime = ? WHERE id = ?", (mtime, row[0]))
+            return False
+
+        fs = var.sample_rate
+        t0 = var.t0
+        starts, stats, rate = window_features(get_dwt(var.value, MAX_SCALE, key=key), fs, window)
+        wn = int(round(window * fs))
+        with self.db:
+            self.db.execute("DELETE FROM recordings WHERE name = ?", (name,))
+            rid = self.db.execute(
+                "INSERT INTO recordings (name, content_key, mtime, samples, sample_rate, window, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, key, mtime, len(var.value), fs, window, time.time())).lastrowid
+            self.db.executemany(
+                "INSERT INTO windows VALUES (?, ?, ?, ?, ?)",
+                [(rid, i, t0 + s / fs, t0 + (s + wn) / fs, None if np.isnan(r) else float(r))
+                 for i, (s, r) in enumerate(zip(starts.tolist(), rate))])
+            nscales, nwin = stats.shape[:2]
+            self.db.executemany(
+                "INSERT INTO features VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(rid, i, j + 1, *stats[j, i].tolist()) for j in range(nscales) for i in range(nwin)])
+        return True
+
+    def build(self, names, window=WINDOW, force=False):
+        # files that cannot be indexed (multi-channel, coefficient files) are
+        # reported and left out instead of stopping the build
+        done = unchanged = skipped = 0
+        for name in names:
+            try:
+                indexed = self.add(name, window, force)
+            except ValueError as e:
+                print(f"skipped {e}")
+                skipped += 1
+                continue
+            if indexed:
+                done += 1
+            else:
+                unchanged += 1
+        # drop recordings whose files are gone
+        with self.db:
+            for rid, name in self.db.execute("SELECT id, name FROM recordings").fetchall():
+                if not os.path.exists(f"{name}.sig"):
+                    self.db.execute("DELETE FROM recordings WHERE id = ?", (rid,))
+        return done, unchanged, skipped
+
+    def query(self, resp_above=None, resp_below=None, scale=None, energy_above=None,
+              freq_between=None, limit=None):
+        # windows matching every given condition, one row per window and
+        # scale (scale features are left out when no scale condition is given)
+        where, params = [], []
+        if resp_above is not None:
+            where.append("w.resp_rate > ?")
+            params.append(resp_above)
+        if resp_below is not None:
+            where.append("w.resp_rate < ?")
+            params.append(resp_below)
+        use_features = scale is not None or energy_above is not None or freq_between is not None
+        if scale is not None:
+            where.append("f.scale = ?")
+            params.append(scale)
+        if energy_above is not None:
+            where.append("f.energy > ?")
+            params.append(energy_above)
+        if freq_between is not None:
+            where.append("f.dom_freq BETWEEN ? AND ?")
+            params.extend(freq_between)
+        columns = "r.name, w.idx, w.start, w.stop, w.resp_rate"
+        sql = f"SELECT {columns} FROM windows w JOIN recordings r ON r.id = w.recording_id"
+        if use_features:
+            columns += ", f.scale, f.energy, f.dom_freq, f.mean, f.std, f.min, f.max"
+            sql = (f"SELECT {columns} FROM windows w JOIN recordings r ON r.id = w.recording_id "
+                   "JOIN features f ON f.recording_id = w.recording_id AND f.idx = w.idx")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY r.name, w.idx"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self.db.execute(sql, params).fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-window DWT feature index of a signal library.")
+    parser.add_argument("--db", default=DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="index new or changed recordings")
+    build.add_argument("inputs", nargs="+", help="directories or glob patterns of .sig files")
+    build.add_argument("--window", type=float, default=WINDOW)
+    build.add_argument("--force", action="store_true")
+    query = sub.add_parser("query", help="list matching windows")
+    query.add_argument("--resp-above", type=float)
+    query.add_argument("--resp-below", type=float)
+    query.add_argument("--scale", type=int)
+    query.add_argument("--energy-above", type=float)
+    query.add_argument("--freq-between", type=float, nargs=2)
+    query.add_argument("--limit", type=int)
+    args = parser.parse_args(argv)
+
+    index = FeatureIndex(args.db)
+    try:
+        if args.command == "build":
+            t0 = time.perf_counter()
+            done, unchanged, skipped = index.build(find_inputs(args.inputs), args.window, args.force)
+            print(f"{done} indexed, {unchanged} unchanged, {skipped} skipped "
+                  f"in {time.perf_counter() - t0:.2f} s")
+        else:
+            t0 = time.perf_counter()
+            rows = index.query(args.resp_above, args.resp_below, args.scale, args.energy_above,
+                               args.freq_between, args.limit)
+            for row in rows:
+                print("\t".join(f"{v:.4g}" if isinstance(v, float) else str(v) for v in row))
+            print(f"{len(rows)} windows in {(time.perf_counter() - t0) * 1e3:.1f} ms")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
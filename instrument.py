@@ -0,0 +1,164 @@
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+# cProfile and tracemalloc are process-wide: a second active profiler raises
+# ValueError on Python 3.12+ and tracemalloc has a single peak, so only one
+# thread at a time profiles or traces; the others just skip it
+_profile_lock = threading.Lock()
+_trace_lock = threading.Lock()
+
+
+class Recorder:
+    # per-stage wall-clock timers and counters; optionally a cProfile and a
+    # tracemalloc peak for the outermost stage of each call chain
+    def __init__(self, profile=False, trace_memory=False):
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+            self.memory = {}
+            self.profiles = {}
+
+    @contextmanager
+    def stage(self, name):
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        outer = depth == 0
+        profiler = None
+        if outer and self.profile and _profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # another profiling tool (debugger, coverage) owns the hook
+                profiler = None
+                _profile_lock.release()
+        tracing = outer and self.trace_memory and _trace_lock.acquire(blocking=False)
+        if tracing:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self._local.depth = depth
+            if profiler is not None:
+                profiler.disable()
+                _profile_lock.release()
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(15)
+                self.profiles[name] = out.getvalue()
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1]
+                if started:
+                    tracemalloc.stop()
+                _trace_lock.release()
+                with self._lock:
+                    self.memory[name] = max(self.memory.get(name, 0), peak)
+            self._record(name, 1, elapsed, elapsed, elapsed, elapsed)
+
+    def _record(self, name, count, total, lo, hi, last):
+        with self._lock:
+            s = self.stages.get(name)
+            if s is None:
+                self.stages[name] = {"count": count, "total": total, "min": lo, "max": hi, "last": last}
+            else:
+                s["count"] += count
+                s["total"] += total
+                s["min"] = min(s["min"], lo)
+                s["max"] = max(s["max"], hi)
+                s["last"] = last
+
+    def timed(self, name):
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        with self._lock:
+            stages = {name: dict(s, mean=s["total"] / s["count"]) for name, s in self.stages.items()}
+            return {
+                "stages": stages,
+                "counters": dict(self.counters),
+                "memory_peak": dict(self.memory),
+                "profiles": dict(self.profiles),
+            }
+
+    def merge(self, report):
+        # fold in a report from another process, e.g. a batch worker
+        for name, s in report["stages"].items():
+            self._record(name, s["count"], s["total"], s["min"], s["max"], s["last"])
+        for name, n in report["counters"].items():
+            self.count(name, n)
+        with self._lock:
+            for name, peak in report["memory_peak"].items():
+                self.memory[name] = max(self.memory.get(name, 0), peak)
+            self.profiles.update(report["profiles"])
+
+    def to_json(self, path=None):
+        text = json.dumps(self.report(), indent=2)
+        if path is not None:
+            with open(path, 'w') as file:
+                file.write(text)
+        return text
+
+
+# process-wide recorder used by the pipeline modules
+recorder = Recorder()
+stage = recorder.stage
+count = recorder.count
+timed = recorder.timed
+
+
+def render_sidebar(rec=recorder):
+    # Streamlit panel with the stage timings, counters and a JSON download.
+    # The recorder is process-wide, so its switches, timings and reset are
+    # shared by every session of the server
+    import streamlit as st
+
+    with st.sidebar.expander("Performance"):
+        st.caption("Shared by all sessions of this server: the switches and Reset apply to everyone.")
+        rec.profile = st.checkbox("cProfile outer stages", value=rec.profile,
+                                  help="One stage is profiled at a time, concurrent ones are skipped.")
+        rec.trace_memory = st.checkbox("Trace memory peaks", value=rec.trace_memory,
+                                       help="One stage is traced at a time, concurrent ones are skipped.")
+        report = rec.report()
+        rows = [{"stage": name, "count": s["count"], "last ms": s["last"] * 1e3,
+                 "mean ms": s["mean"] * 1e3, "max ms": s["max"] * 1e3}
+                for name, s in sorted(report["stages"].items())]
+        if rows:
+            st.dataframe(rows, hide_index=True)
+        if report["counters"]:
+            st.json(report["counters"])
+        if report["memory_peak"]:
+            st.json({k: f"{v / 1024**2:.1f} MB" for k, v in report["memory_peak"].items()})
+        for name, text in report["profiles"].items():
+            st.text(f"{name}\n{text}")
+        st.download_button("Download JSON", rec.to_json(), file_name="timings.json",
+                           mime="application/json")
+        if st.button("Reset timings"):
+            rec.reset()
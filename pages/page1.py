@@ -1,62 +1,78 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
-from dwt_coeff import DWTCoeff  
-from deps import handler        
+import os
+from background import ScaleJob
+from cache import default_cache, file_key
+from dwt import DWT8_SCALE
+from deps import handler, Signal        
+from plots import decimate, scale_figure, POINTS
+from instrument import render_sidebar, stage
 
 st.set_page_config(layout="wide")
 st.title("PPG Signal Analysis with DWT")
 
-@st.cache_data
-def compute_dwt_coefficients():
-    coeff = DWTCoeff()
+def load_recording():
     var = handler.load("rawdata")
-    ppgdata = var.value.to_numpy()
-    time = var.time.to_numpy()
-    total = len(ppgdata)
-    w2fb = np.zeros((9, total))
+    ppgdata = np.asarray(var.value)
+    time = np.asarray(var.time)
     scalecount = 8
+    # hashed once per version of the file, not on every rerun
+    key = file_key("rawdata", scalecount)
+    return time, ppgdata, scalecount, key
+
+# shared by all sessions, 9 traces per slider position: keep the most
+# recent few dozen views
+@st.cache_data(max_entries=9 * 32)
+def decimated_trace(key, j, lo, hi, method, _time, _y, points=POINTS):
+    # scale j of the window lo..hi seconds, j = 0 is the raw PPG; the
+    # underscored arrays are not hashed, key (content hash of rawdata) and j
+    # identify them
+    a = np.searchsorted(_time, lo, side='left')
+    b = np.searchsorted(_time, hi, side='right')
+    return decimate(_time[a:b], _y[a:b], points, method)
+
+def draw(slot, j, row):
+    with stage("render"):
+        x, y = decimated_trace(key, j, lo, hi, method, time, row)
+        fig = scale_figure(x, y, ppgy, j, ppgtime=ppgx)
+        slot.plotly_chart(fig, use_container_width=True)
+
+time, ppgdata, scalecount, key = load_recording()
+
+t0, t1 = float(time[0]), float(time[-1])
+lo, hi = st.slider("Time range (s)", t0, t1, (t0, t1))
+method = st.sidebar.radio("Downsampling", ["minmax", "lttb"])
+ppgx, ppgy = decimated_trace(key, 0, lo, hi, method, time, ppgdata)
+
+# row j-1 holds scale j
+w2fb = default_cache.peek(key)
+if w2fb is not None:
     for j in range(1, scalecount + 1):
-        res = coeff.get_filter(scale=j)
-        T = round(2**(j-1)) - 1
-        start = len(res)
-        for n in range(start, total):
-            signalNEW = ppgdata[n - len(res):n]
-            w2fb[j, n - T] = np.sum(signalNEW * res[::-1])
-    
-    return time, ppgdata, w2fb, scalecount
-
-time, ppgdata, w2fb, scalecount = compute_dwt_coefficients()
-
-for j in range(1, scalecount + 1):
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=time,
-        y=w2fb[j],
-        mode='lines',
-        line=dict(color='blue'),
-        name=f'DWT Skala {j}'
-    ))
-
-    fig.add_trace(go.Scatter(
-        x=time,
-        y=ppgdata,
-        mode='lines',
-        line=dict(color='red'),
-        name='PPG Baseline',
-        opacity=0.4
-    ))
-
-    fig.update_layout(
-        title=f"Hasil DWT Skala {j}",
-        xaxis_title='Time (s)',
-        yaxis_title='Amplitude',
-        height=400,
-        legend=dict(x=0.01, y=0.99, xanchor='left', yanchor='top'),
-        margin=dict(t=50, b=40, l=40, r=20)
-    )
-
-    st.plotly_chart(fig, use_container_width=True)
-
-handler.save(time,w2fb[7], filename="dwt8")
\ No newline at end of file
+        draw(st, j, w2fb[j-1])
+else:
+    # compute in the background and draw every scale as soon as it is ready;
+    # a job for other data is cancelled, one for this data is picked up again
+    job = st.session_state.get("dwt_job")
+    if job is None or job.key != key or job.cancelled:
+        if job is not None:
+            job.cancel()
+        job = ScaleJob(ppgdata, key, scalecount)
+        st.session_state.dwt_job = job
+    progress = st.progress(job.progress, text="Computing DWT scales")
+    slots = {j: st.empty() for j in range(1, scalecount + 1)}
+    for j, row in job.as_completed():
+        draw(slots[j], j, row)
+        progress.progress(job.progress, text=f"Computing DWT scales ({round(job.progress * scalecount)}/{scalecount})")
+    progress.empty()
+    w2fb = job.result()
+    default_cache.put(key, w2fb)
+    del st.session_state.dwt_job
+
+# only rewrite dwt8 when rawdata or the respiratory scale changed
+dwt8_meta = {"source": key, "scale": DWT8_SCALE}
+if not os.path.exists("dwt8.sig") or handler.header("dwt8").get("meta") != dwt8_meta:
+    handler.save_signal(Signal(w2fb[DWT8_SCALE-1], handler.header("rawdata")["sample_rate"], t0),
+                        "dwt8", meta=dwt8_meta)
+
+render_sidebar()
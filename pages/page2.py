@@ -0,0 +1,70 @@
+import os
+import streamlit as st
+import numpy as np
+import plotly.graph_objects as go
+from deps import handler
+from plots import decimate
+from resp import respiratory_rate, WINDOW, STEP
+from instrument import render_sidebar, stage
+from background import cancel_session_job
+
+st.set_page_config(layout="wide")
+cancel_session_job(st.session_state)
+st.title("Respiratory Rate Calculation")
+
+@st.cache_data
+def load_band(mtime):
+    # mtime only keys the cache, dwt8 is rewritten by page1
+    sig = handler.load_signal("dwt8")
+    return sig.time, np.asarray(sig.value), sig.sample_rate
+
+@st.cache_data
+def compute_rate(mtime, window, step):
+    time, band, fs = load_band(mtime)
+    peaks, t, bpm = respiratory_rate(band, fs, window, step, t0=float(time[0]))
+    return peaks, t, bpm
+
+if not os.path.exists("dwt8.sig"):
+    st.warning("No respiratory band yet, open the Respiratory Signal page first.")
+    st.stop()
+
+mtime = os.path.getmtime("dwt8.sig")
+window = st.sidebar.slider("Window (s)", 10.0, 120.0, WINDOW, step=5.0)
+step = st.sidebar.slider("Step (s)", 1.0, 30.0, STEP, step=1.0)
+
+time, band, fs = load_band(mtime)
+peaks, t, bpm = compute_rate(mtime, window, step)
+
+col1, col2, col3 = st.columns(3)
+col1.metric("Mean rate (bpm)", f"{np.nanmean(bpm):.1f}" if np.isfinite(bpm).any() else "-")
+col2.metric("Breaths detected", len(peaks))
+col3.metric("Windows", len(bpm))
+
+with stage("render"):
+    fig = go.Figure()
+    x, y = decimate(time, band)
+    fig.add_trace(go.Scatter(x=x, y=y, mode='lines', line=dict(color='blue'), name='Respiratory band'))
+    fig.add_trace(go.Scatter(x=time[peaks], y=band[peaks], mode='markers',
+                             marker=dict(color='red', size=6), name='Breath'))
+    fig.update_layout(
+        title="Respiratory Signal and Detected Breaths",
+        xaxis_title='Time (s)',
+        yaxis_title='Amplitude',
+        height=400,
+        legend=dict(x=0.01, y=0.99, xanchor='left', yanchor='top'),
+        margin=dict(t=50, b=40, l=40, r=20)
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=t, y=bpm, mode='lines+markers', line=dict(color='green'), name='Rate'))
+    fig.update_layout(
+        title=f"Respiratory Rate ({window:g} s window, {step:g} s step)",
+        xaxis_title='Time (s)',
+        yaxis_title='Breaths per minute',
+        height=400,
+        margin=dict(t=50, b=40, l=40, r=20)
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+render_sidebar()
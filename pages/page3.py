@@ -0,0 +1,33 @@
+import streamlit as st
+import numpy as np
+import plotly.graph_objects as go
+from plots import decimate
+from spectrum import analyze, scale_label, select_scale, SEGMENT
+from instrument import render_sidebar, stage
+from background import cancel_session_job
+
+st.set_page_config(layout="wide")
+cancel_session_job(st.session_state)
+st.title("Vasometric Activity Signal")
+
+scale = select_scale()
+res = analyze("rawdata", scale, SEGMENT)
+
+with stage("render"):
+    x, y = decimate(res["time"], res["band"])
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=x, y=y, mode='lines', line=dict(color='blue'), name=scale_label(scale)))
+    fig.update_layout(
+        title=f"Vasometric Activity ({scale_label(scale)})",
+        xaxis_title='Time (s)',
+        yaxis_title='Amplitude',
+        height=400,
+        margin=dict(t=50, b=40, l=40, r=20)
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    col1, col2 = st.columns(2)
+    col1.metric("Peak frequency (Hz)", f"{res['peak']:.3f}")
+    col2.metric("RMS", f"{np.sqrt(np.mean(res['band'] ** 2)):.3f}")
+
+render_sidebar()
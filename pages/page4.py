@@ -0,0 +1,47 @@
+import streamlit as st
+import plotly.graph_objects as go
+from plots import decimate
+from spectrum import analyze, scale_label, select_scale, SEGMENT
+from instrument import render_sidebar, stage
+from background import cancel_session_job
+
+st.set_page_config(layout="wide")
+cancel_session_job(st.session_state)
+st.title("DFT/FFT of Vasometric Activity")
+
+scale = select_scale()
+segment = st.sidebar.select_slider("Welch segment (s)", [16.0, 32.0, 64.0, 128.0, 256.0], value=SEGMENT)
+fmax = st.sidebar.slider("Max frequency (Hz)", 0.5, 10.0, 2.0, step=0.5)
+res = analyze("rawdata", scale, segment)
+
+st.metric("Peak frequency (Hz)", f"{res['peak']:.3f}")
+
+with stage("render"):
+    keep = res["freqs"] <= fmax
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=res["freqs"][keep], y=res["psd"][keep], mode='lines',
+                             line=dict(color='blue'), name='Welch PSD'))
+    fig.add_vline(x=res["peak"], line=dict(color='red', dash='dash'))
+    fig.update_layout(
+        title=f"Welch PSD, {scale_label(scale)} ({segment:g} s segments)",
+        xaxis_title='Frequency (Hz)',
+        yaxis_title='Power',
+        height=400,
+        margin=dict(t=50, b=40, l=40, r=20)
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    keep = res["fft_freqs"] <= fmax
+    x, y = decimate(res["fft_freqs"][keep], res["fft_amp"][keep])
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=x, y=y, mode='lines', line=dict(color='green'), name='FFT'))
+    fig.update_layout(
+        title=f"FFT Magnitude, {scale_label(scale)}",
+        xaxis_title='Frequency (Hz)',
+        yaxis_title='Amplitude',
+        height=400,
+        margin=dict(t=50, b=40, l=40, r=20)
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+render_sidebar()
@@ -0,0 +1,83 @@
+import numpy as np
+import plotly.graph_objects as go
+from instrument import timed
+
+# points per trace sent to the browser, about two per horizontal pixel
+POINTS = 2000
+
+
+def minmax_decimate(x, y, n_out=POINTS):
+    # keep the min and max sample of n_out/2 equal buckets, in time order
+    n = len(y)
+    if n <= n_out or n_out < 2:
+        return np.asarray(x), np.asarray(y)
+    size = -(-n // (n_out // 2))
+    nbuckets = -(-n // size)
+    padded = np.full(nbuckets * size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(nbuckets, size)
+    offset = np.arange(nbuckets) * size
+    idx = np.sort(np.stack((np.nanargmin(buckets, axis=1) + offset,
+                            np.nanargmax(buckets, axis=1) + offset), axis=1), axis=1).ravel()
+    return np.asarray(x)[idx], np.asarray(y)[idx]
+
+
+def lttb(x, y, n_out=POINTS):
+    # largest triangle three buckets, keeps first and last sample
+    n = len(y)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if n <= n_out or n_out < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return x[idx], y[idx]
+
+
+@timed("postprocess.decimate")
+def decimate(x, y, n_out=POINTS, method="minmax"):
+    if method == "lttb":
+        return lttb(x, y, n_out)
+    if method == "minmax":
+        return minmax_decimate(x, y, n_out)
+    raise ValueError(f"Unknown decimation method {method!r}.")
+
+
+def scale_figure(time, coeffs, ppgdata, j, ppgtime=None):
+    # ppgtime: time axis of ppgdata when it was decimated separately
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=time,
+        y=coeffs,
+        mode='lines',
+        line=dict(color='blue'),
+        name=f'DWT Skala {j}'
+    ))
+
+    fig.add_trace(go.Scatter(
+        x=time if ppgtime is None else ppgtime,
+        y=ppgdata,
+        mode='lines',
+        line=dict(color='red'),
+        name='PPG Baseline',
+        opacity=0.4
+    ))
+
+    fig.update_layout(
+        title=f"Hasil DWT Skala {j}",
+        xaxis_title='Time (s)',
+        yaxis_title='Amplitude',
+        height=400,
+        legend=dict(x=0.01, y=0.99, xanchor='left', yanchor='top'),
+        margin=dict(t=50, b=40, l=40, r=20)
+    )
+    return fig
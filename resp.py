@@ -0,0 +1,142 @@
+import numpy as np
+from instrument import timed
+
+# sliding window for the rate, seconds
+WINDOW = 30.0
+STEP = 5.0
+# positive lobes shorter than this are noise, not breaths (about 75 bpm max)
+MIN_LOBE = 0.4
+
+
+def _lobes(x):
+    # positive lobes of x as (rising, falling) crossing indices; falling is
+    # the first non-positive sample after the lobe
+    pos = x > 0
+    change = np.flatnonzero(pos[1:] != pos[:-1]) + 1
+    rising = change[pos[change]]
+    falling = change[~pos[change]]
+    k = np.searchsorted(falling, rising)
+    ok = k < len(falling)
+    return rising[ok], falling[k[ok]], falling
+
+
+def _peaks(x, rising, falling):
+    # highest local maximum inside every lobe
+    if not len(rising):
+        return np.zeros(0, dtype=int)
+    i = np.flatnonzero((x[1:-1] > x[:-2]) & (x[1:-1] >= x[2:]) & (x[1:-1] > 0)) + 1
+    lobe = np.searchsorted(rising, i, side='right') - 1
+    ok = (lobe >= 0) & (i < falling[np.maximum(lobe, 0)])
+    i, lobe = i[ok], lobe[ok]
+    order = np.lexsort((-x[i], lobe))
+    _, first = np.unique(lobe[order], return_index=True)
+    return i[order][first]
+
+
+def find_breaths(band, fs, min_lobe=MIN_LOBE, min_amp=0.0):
+    # sample indices of the breath peaks in the respiratory band
+    x = np.asarray(band, dtype=np.float64)
+    if x.ndim != 1:
+        raise ValueError("find_breaths works on one channel at a time.")
+    if len(x) < 3:
+        return np.zeros(0, dtype=int)
+    rising, falling, _ = _lobes(x)
+    keep = (falling - rising) >= min_lobe * fs
+    peaks = _peaks(x, rising[keep], falling[keep])
+    return peaks[x[peaks] >= min_amp]
+
+
+def rate_windows(peaks, n, fs, window=WINDOW, step=STEP, first=0):
+    # breaths per minute over windows [k*step, k*step + window) that end
+    # within n samples; returns (start index, bpm), nan below two breaths
+    wn, sn = int(round(window * fs)), int(round(step * fs))
+    starts = np.arange(first * sn, n - wn + 1, sn) if n >= wn else np.zeros(0, dtype=int)
+    lo = np.searchsorted(peaks, starts)
+    hi = np.searchsorted(peaks, starts + wn)
+    count = hi - lo
+    bpm = np.full(len(starts), np.nan)
+    ok = count >= 2
+    span = peaks[hi[ok] - 1] - peaks[lo[ok]]
+    bpm[ok] = (count[ok] - 1) * 60 * fs / span
+    return starts, bpm
+
+
+@timed("postprocess.resp_rate")
+def respiratory_rate(band, fs, window=WINDOW, step=STEP, t0=0.0,
+                     min_lobe=MIN_LOBE, min_amp=0.0):
+    # returns (breath peak indices, window centre times, bpm)
+    peaks = find_breaths(band, fs, min_lobe, min_amp)
+    starts, bpm = rate_windows(peaks, len(band), fs, window, step)
+    return peaks, t0 + (starts + window * fs / 2) / fs, bpm
+
+
+class RespRateTracker:
+    # incremental respiratory_rate: push() returns the windows that can no
+    # longer change, with the same values as the batch computation
+    def __init__(self, fs, window=WINDOW, step=STEP, t0=0.0,
+                 min_lobe=MIN_LOBE, min_amp=0.0):
+        self.fs = fs
+        self.window = window
+        self.step = step
+        self.t0 = t0
+        self.min_lobe = min_lobe
+        self.min_amp = min_amp
+        self.peaks = np.zeros(0, dtype=int)
+        self.received = 0
+        self._buf = np.zeros(0)
+        self._buf_start = 0
+        self._windows = 0
+        self.times = []
+        self.bpm = []
+
+    def push(self, samples):
+        self._buf = np.concatenate((self._buf, np.asarray(samples, dtype=np.float64).ravel()))
+        self.received += len(samples)
+        x = self._buf
+        if len(x) >= 3:
+            rising, falling, all_falling = _lobes(x)
+            keep = (falling - rising) >= self.min_lobe * self.fs
+            new = _peaks(x, rising[keep], falling[keep])
+            new = new[x[new] >= self.min_amp] + self._buf_start
+            self.peaks = np.concatenate((self.peaks, new))
+            # lobes before the last falling crossing are final
+            if len(all_falling):
+                cut = all_falling[-1]
+                self._buf = x[cut:]
+                self._buf_start += cut
+        return self._emit(self._buf_start)
+
+    def flush(self):
+        return self._emit(self.received)
+
+    def _emit(self, n):
+        starts, bpm = rate_windows(self.peaks, n, self.fs, self.window, self.step,
+                                   first=self._windows)
+        times = self.t0 + (starts + self.window * self.fs / 2) / self.fs
+        self._windows += len(starts)
+        self.times.extend(times)
+        self.bpm.extend(bpm)
+        return times, bpm
+
+
+def check(recording="rawdata", tolerance=0.15):
+    # the detected rate must agree with the spectral peak of the band it
+    # was detected in; returns (median bpm, peak bpm, ok)
+    from deps import handler
+    from cache import get_dwt
+    from dwt import DWT8_SCALE
+    from spectrum import welch, peak_frequency, SEGMENT
+    var = handler.load(recording)
+    fs = var.sample_rate
+    band = np.asarray(get_dwt(var.value)[DWT8_SCALE-1])
+    _, _, bpm = respiratory_rate(band, fs)
+    freqs, psd = welch(band, fs, int(round(SEGMENT * fs)))
+    rate, peak = float(np.nanmedian(bpm)), peak_frequency(freqs, psd) * 60
+    return rate, peak, abs(rate - peak) <= tolerance * peak
+
+
+if __name__ == "__main__":
+    import sys
+    rate, peak, ok = check(*sys.argv[1:2])
+    print(f"median rate {rate:.1f} bpm, spectral peak {peak:.1f} bpm: {'ok' if ok else 'MISMATCH'}")
+    sys.exit(0 if ok else 1)
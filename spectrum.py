@@ -0,0 +1,98 @@
+import os
+from functools import lru_cache
+import numpy as np
+from deps import handler
+from cache import get_dwt
+from dwt import approximation, next_pow2
+from dwt_coeff import MAX_SCALE
+from instrument import timed
+
+# scale 0 stands for the residual approximation below the last detail scale.
+# Detail scale 8 already holds respiration (about 0.3 Hz), vasometric activity
+# lies below it
+RESIDUAL = 0
+VASO_SCALE = RESIDUAL
+# Welch segment length in seconds
+SEGMENT = 64.0
+
+
+def fft_spectrum(x, fs):
+    # one-sided amplitude spectrum along the last axis, zero-padded to the
+    # next power of two
+    x = np.asarray(x, dtype=np.float64)
+    n = x.shape[-1]
+    nfft = next_pow2(max(n, 2))
+    amp = np.abs(np.fft.rfft(x - x.mean(axis=-1, keepdims=True), nfft)) * 2 / max(n, 1)
+    return np.fft.rfftfreq(nfft, 1 / fs), amp
+
+
+def welch(x, fs, nperseg, overlap=0.5):
+    # averaged periodogram of Hann-windowed, half-overlapping segments, along
+    # the last axis
+    x = np.asarray(x, dtype=np.float64)
+    nperseg = int(min(nperseg, x.shape[-1]))
+    step = max(int(nperseg * (1 - overlap)), 1)
+    nfft = next_pow2(nperseg)
+    segs = np.lib.stride_tricks.sliding_window_view(x, nperseg, axis=-1)[..., ::step, :]
+    win = np.hanning(nperseg)
+    segs = (segs - segs.mean(axis=-1, keepdims=True)) * win
+    psd = (np.abs(np.fft.rfft(segs, nfft)) ** 2).mean(axis=-2) / (fs * (win ** 2).sum())
+    psd[..., 1:-1] *= 2
+    return np.fft.rfftfreq(nfft, 1 / fs), psd
+
+
+def peak_frequency(freqs, power, fmin=0.0, fmax=None):
+    band = (freqs > fmin) & (freqs <= (fmax if fmax is not None else freqs[-1]))
+    # one peak per leading index of power
+    if band.any():
+        peak = freqs[band][np.argmax(power[..., band], axis=-1)]
+    else:
+        peak = np.full(np.shape(power)[:-1], np.nan)
+    return float(peak) if np.ndim(peak) == 0 else peak
+
+
+@lru_cache(maxsize=32)
+@timed("postprocess.spectrum")
+def _analyze(recording, mtime, scale, segment):
+    var = handler.load(recording)
+    fs = var.sample_rate
+    if scale == RESIDUAL:
+        band = approximation(var.value)
+    else:
+        band = np.array(get_dwt(var.value)[..., scale-1, :])
+    freqs, psd = welch(band, fs, int(round(segment * fs)))
+    ffreqs, amp = fft_spectrum(band, fs)
+    for a in (band, freqs, psd, ffreqs, amp):
+        a.setflags(write=False)
+    return {
+        "time": np.asarray(var.time),
+        "band": band,
+        "fs": fs,
+        "freqs": freqs,
+        "psd": psd,
+        "fft_freqs": ffreqs,
+        "fft_amp": amp,
+        "peak": peak_frequency(freqs, psd),
+    }
+
+
+def scale_label(scale):
+    return "DWT Residual" if scale == RESIDUAL else f"DWT Skala {scale}"
+
+
+def select_scale():
+    # sidebar scale picker shared by the vasometric pages, defaulting to the
+    # residual and noting when a detail band is picked instead
+    import streamlit as st
+
+    scales = [RESIDUAL] + list(range(1, MAX_SCALE + 1))
+    scale = st.sidebar.selectbox("DWT scale", scales, index=scales.index(VASO_SCALE), format_func=scale_label)
+    if scale != RESIDUAL:
+        st.info(f"{scale_label(scale)} is a detail band; the cardiac and respiratory components sit in "
+                f"these scales, vasometric activity is the residual below scale {MAX_SCALE}.")
+    return scale
+
+
+def analyze(recording, scale=VASO_SCALE, segment=SEGMENT):
+    # memoized per (recording, file mtime, scale, segment); arrays are read-only
+    return _analyze(recording, os.path.getmtime(f"{recording}.sig"), scale, float(segment))
@@ -0,0 +1,17 @@
+import numpy as np
+
+
+def synthetic_ppg(n, fs=125.0, seed=0):
+    # pulse train with harmonics, respiratory amplitude and baseline
+    # modulation, slow wander and white noise; returns (time, value)
+    rng = np.random.default_rng(seed)
+    time = np.arange(n) / fs
+    hr = 1.2 + 0.05 * rng.standard_normal()
+    rr = 0.25 + 0.02 * rng.standard_normal()
+    phase = 2 * np.pi * hr * time
+    resp = np.sin(2 * np.pi * rr * time)
+    pulse = np.sin(phase) + 0.5 * np.sin(2 * phase - 0.8) + 0.2 * np.sin(3 * phase - 1.6)
+    value = ((1 + 0.2 * resp) * pulse + 0.4 * resp
+             + 0.3 * np.sin(2 * np.pi * 0.02 * time)
+             + 0.05 * rng.standard_normal(n))
+    return time, value
@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import pickle
+import tempfile
+import time
+import numpy as np
+import chunked
+import dwt
+from cache import DWTCache
+from deps import handler, Signal
+from dwt_coeff import DWTCoeff, FilterBank, MAX_SCALE
+from synth import synthetic_ppg
+
+# max |fast - reference| allowed, relative to the peak |reference| of each scale
+RTOL = {"float64": 1e-10, "float32": 1e-5}
+SYNTH_LENGTHS = [0, 1, 300, 509, 510, 511, 5000, 20000]
+
+
+def reference(ppgdata, scalecount=MAX_SCALE):
+    # the original page1 loop with the dirac-expanded filters, kept as the
+    # oracle; returns the new (scales, N) layout
+    coeff = DWTCoeff()
+    total = len(ppgdata)
+    w2fb = np.zeros((9, total))
+    for j in range(1, scalecount + 1):
+        res = coeff._expand_filter(scale=j)
+        T = round(2**(j-1)) - 1
+        start = len(res)
+        for n in range(start, total):
+            signalNEW = ppgdata[n - len(res):n]
+            w2fb[j, n - T] = np.sum(signalNEW * res[::-1])
+    return w2fb[1:scalecount + 1]
+
+
+def support(j, total):
+    # columns the reference can make nonzero for scale j
+    L = len(DWTCoeff().get_filter(j))
+    T = round(2**(j-1)) - 1
+    mask = np.zeros(total, dtype=bool)
+    mask[max(L - T, 0):max(total - T, 0)] = True
+    return mask
+
+
+def compare(ref, got):
+    # worst relative error over the scales, inf when the shape is off or a
+    # column the reference leaves at zero is not exactly zero
+    if got.shape != ref.shape:
+        return float("inf")
+    worst = 0.0
+    for j in range(ref.shape[0]):
+        mask = support(j + 1, ref.shape[1])
+        if np.any(got[j][~mask] != 0):
+            return float("inf")
+        scale = max(np.abs(ref[j]).max(initial=0.0), 1e-300)
+        worst = max(worst, np.abs(got[j] - ref[j]).max(initial=0.0) / scale)
+    return worst
+
+
+def compare_decimated(ref, details):
+    # every column of the support a decimated sample of scale j lands on
+    # (dwt.mallat_positions) against the reference, inf when a scale is
+    # missing or too short to reach all of them
+    if len(details) != ref.shape[0]:
+        return float("inf")
+    worst = 0.0
+    for j, d in enumerate(details, 1):
+        first = int(dwt.mallat_positions(j, 1)[0])
+        want = np.flatnonzero(support(j, ref.shape[1]))
+        want = want[(want - first) % 2**j == 0]
+        k = (want - first) // 2**j
+        if np.any(k < 0) or np.any(k >= len(d)):
+            return float("inf")
+        scale = max(np.abs(ref[j-1]).max(initial=0.0), 1e-300)
+        worst = max(worst, np.abs(d[k] - ref[j-1][want]).max(initial=0.0) / scale)
+    return worst
+
+
+def streamed(x):
+    rng = np.random.default_rng(len(x))
+    s = dwt.StreamingDWT()
+    parts, pos = [], 0
+    while pos < len(x):
+        n = int(rng.integers(1, 4096))
+        parts.append(s.push(x[pos:pos + n]))
+        pos += n
+    parts.append(s.flush())
+    return np.concatenate(parts, axis=1)
+
+
+def windowed(x):
+    # stitched from uneven windows, each only from its own margin
+    edges = sorted({0, len(x), *np.linspace(0, len(x), 7).astype(int)[1:-1]})
+    parts = [dwt.transform(x, start=a, stop=b) for a, b in zip(edges[:-1], edges[1:])]
+    return np.concatenate(parts, axis=1) if parts else dwt.transform(x)
+
+
+def selected(x):
+    # scales requested out of order, put back in 1..8 order
+    order = [8, 3, 1, 6, 2, 7, 5, 4]
+    w = dwt.transform(x, scales=order)
+    return w[np.argsort(order)]
+
+
+def batched(x):
+    # three channels, checked on the middle one
+    return dwt.transform(np.stack((-x, x, 2 * x)))[1]
+
+
+def engines(tmpdir):
+    # name, function of the signal, tolerance class
+    def via_chunked(x):
+        handler.save_signal(Signal(x, 125.0), os.path.join(tmpdir, "src"))
+        res = chunked.transform_to_file(os.path.join(tmpdir, "src"), os.path.join(tmpdir, "dst"),
+                                        chunk=4093, workers=4)
+        return np.asarray(res.data)
+
+    cache = DWTCache(os.path.join(tmpdir, "cache"))
+
+    def via_cache(x):
+        cache.clear()
+        cache.get(x)
+        cache.clear()
+        return np.asarray(cache.get(x))
+
+    return [
+        ("vectorized", dwt.transform, "float64"),
+        ("streaming", streamed, "float64"),
+        ("windowed", windowed, "float64"),
+        ("selected", selected, "float64"),
+        ("batched", batched, "float64"),
+        ("chunked", via_chunked, "float64"),
+        ("cache", via_cache, "float64"),
+        ("float32", lambda x: dwt.transform(x, dtype=np.float32), "float32"),
+        ("mallat", dwt.mallat, "float64"),
+    ]
+
+
+def check_filters():
+    bank = FilterBank()
+    coeff = DWTCoeff()
+    return all(np.array_equal(bank.get(j), coeff._expand_filter(j)) for j in range(1, MAX_SCALE + 1))
+
+
+def check_convert(tmpdir):
+    # a pickle in the baseline handler layout (time and value in the
+    # instance dict) must still convert to a .sig file
+    t, x = synthetic_ppg(1000)
+    legacy = handler.__new__(handler)
+    legacy.__dict__.update(time=t, value=x, filename="legacy")
+    name = os.path.join(tmpdir, "legacy")
+    with open(f"{name}.dat", 'wb') as file:
+        pickle.dump(legacy, file)
+    var = handler.convert(name)
+    return np.array_equal(var.value, x) and np.allclose(var.time, t)
+
+
+def run(signals):
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for label, x in signals:
+            t0 = time.perf_counter()
+            ref = reference(x)
+            t_ref = time.perf_counter() - t0
+            for name, fn, dtype in engines(tmpdir):
+                t0 = time.perf_counter()
+                got = fn(x)
+                elapsed = time.perf_counter() - t0
+                if name == "mallat":
+                    err = compare_decimated(ref, got)
+                else:
+                    err = compare(ref, got)
+                ok = err <= RTOL[dtype]
+                results.append({
+                    "signal": label, "samples": len(x), "engine": name, "dtype": dtype,
+                    "max_rel_error": err, "tolerance": RTOL[dtype], "ok": bool(ok),
+                    "reference_s": t_ref, "engine_s": elapsed,
+                    "speedup": t_ref / elapsed if elapsed else float("inf"),
+                })
+                r = results[-1]
+                print(f"{label:<14} {name:<11} err {err:9.2e} (tol {RTOL[dtype]:.0e}) "
+                      f"x{r['speedup']:8.1f} {'ok' if ok else 'FAIL'}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the fast DWT engines against the reference loop.")
+    parser.add_argument("--lengths", type=int, nargs="+", default=SYNTH_LENGTHS)
+    parser.add_argument("--stored", nargs="*", default=["rawdata"],
+                        help="stored .sig recordings to check as well")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    filters_ok = check_filters()
+    print(f"filter bank == dirac expansion: {'ok' if filters_ok else 'FAIL'}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        convert_ok = check_convert(tmpdir)
+    print(f"legacy .dat pickle converts: {'ok' if convert_ok else 'FAIL'}")
+    signals = [(f"synth{n}", synthetic_ppg(n, seed=n)[1]) for n in args.lengths]
+    signals += [(name, np.asarray(handler.load(name).value, dtype=np.float64)) for name in args.stored]
+    results = run(signals)
+    failed = [r for r in results if not r["ok"]]
+    print(f"{len(results) - len(failed)}/{len(results)} checks passed")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({"filters_ok": filters_ok, "convert_ok": convert_ok, "results": results},
+                      file, indent=2)
+    return 0 if filters_ok and convert_ok and not failed else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())